@@ -22,10 +22,10 @@
 
 
 # This script simulates the codebreaker of the game of Bulls & Cows played with
-# six colors and four pegs. Only unique colors are allowed. The algorithm is naive
-# and in each round picks a random combination that is still viable; it does not
-# validate the next combination against a measure that judges its potential of
-# reducing the set of possibilities further. See here for a description of the game:
+# six colors and four pegs. Only unique colors are allowed. In each round the
+# algorithm picks the combination whose worst-case evaluation leaves the fewest
+# viable combinations (Knuth's minimax rule), preferring combinations that could
+# still be the answer. See here for a description of the game:
 # https://en.wikipedia.org/wiki/Bulls_and_Cows
 # See here also for the modern version of the game:
 # https://en.wikipedia.org/wiki/Mastermind_(board_game)
@@ -33,37 +33,97 @@
 
 import random
 import itertools
+from collections import Counter
+from operator import eq
 
 
 def main() -> None:
-    colors = ["Red", "Green", "Blue", "Yellow", "White", "Black"]
-    random.shuffle(colors)
-    possible_permutations = list(itertools.permutations(colors, 4))
-    random.shuffle(possible_permutations)
-    evidence = []
+    color_names = ["Red", "Green", "Blue", "Yellow", "White", "Black"]
+    # Colors are small integers, names are only used to talk to the player. Each color
+    # is also a bit, so the colors of a permutation form a small integer, and the number
+    # of colors two permutations share is the number of bits set in common
+    colors = range(len(color_names))
+    permutations = list(itertools.permutations(colors, 4))
+    color_bits = [sum(1 << color for color in permutation) for permutation in permutations]
+    # The evaluation of every permutation against every other is computed once up front,
+    # one row of bytes per guess, so each round is a lookup instead of a scoring pass
+    evaluations = [
+        bytes(
+            __evaluate(guess, guess_bits, candidate, candidate_bits)
+            for candidate, candidate_bits in zip(permutations, color_bits)
+        )
+        for guess, guess_bits in zip(permutations, color_bits)
+    ]
+    # Guesses are considered in a random order, so ties between equally good guesses
+    # are broken differently from game to game
+    order = random.sample(range(len(permutations)), len(permutations))
+    possible_permutations = order
     location_and_color_matches = None
-    for permutation in possible_permutations:
-        is_candidate = all(map(
-            lambda e:
-                e[1] == sum(x == y for x, y in zip(e[0], permutation)) and
-                e[2] == sum(x in permutation for x in e[0]),
-            evidence
-        ))
-        if is_candidate:
-            print(permutation)
-            location_and_color_matches = int(
-                input("How many exact matches in color and location? ")
-            )
-            color_but_not_location_matches = int(
-                input("How many matches in color only, but not location? ")
-            )
-            evidence.append([
-                permutation,
-                location_and_color_matches,
-                location_and_color_matches + color_but_not_location_matches
-            ])
-    if location_and_color_matches != 4:
+    # Once a single permutation is left it must be the answer, so the player is not
+    # asked to evaluate it
+    while len(possible_permutations) > 1 and location_and_color_matches != 4:
+        guess = __next_guess(evaluations, order, possible_permutations)
+        print(tuple(color_names[color] for color in permutations[guess]))
+        location_and_color_matches = int(
+            input("How many exact matches in color and location? ")
+        )
+        color_but_not_location_matches = int(
+            input("How many matches in color only, but not location? ")
+        )
+        color_matches = location_and_color_matches + color_but_not_location_matches
+        # Evaluations no permutation can produce would otherwise be packed like valid ones
+        if not 0 <= location_and_color_matches <= color_matches <= 4:
+            possible_permutations = []
+            break
+        evaluation = __encode(location_and_color_matches, color_matches)
+        # Keep the permutations that would have been evaluated the same way, so each
+        # permutation is checked once per evaluation, against that evaluation only
+        row = evaluations[guess]
+        possible_permutations = [
+            candidate for candidate in possible_permutations
+            if row[candidate] == evaluation
+        ]
+    if not possible_permutations:
         print("Hey, you cheated with your evaluations!")
+    elif location_and_color_matches != 4:
+        print("The answer is:", tuple(color_names[color] for color in permutations[possible_permutations[0]]))
 
 
-main()
\ No newline at end of file
+def __next_guess(
+        evaluations: list,
+        order: list,
+        possible_permutations: list
+) -> int:
+    """Pick the guess whose most likely evaluation leaves the fewest possible permutations, preferring possible ones"""
+    viable = set(possible_permutations)
+
+    def worst_case(guess: int) -> tuple:
+        row = evaluations[guess]
+        remaining = max(Counter(map(row.__getitem__, possible_permutations)).values())
+        return remaining, guess not in viable
+
+    return min(order, key=worst_case)
+
+
+def __evaluate(
+        guess: tuple,
+        guess_bits: int,
+        candidate: tuple,
+        candidate_bits: int
+) -> int:
+    """Evaluate a guess against a candidate solution, given as permutations and their color bits"""
+    location_and_color_matches = sum(map(eq, guess, candidate))
+    color_matches = bin(guess_bits & candidate_bits).count("1")
+    return __encode(location_and_color_matches, color_matches)
+
+
+def __encode(
+        location_and_color_matches: int,
+        color_matches: int
+) -> int:
+    """Pack an evaluation into a single small integer"""
+    return location_and_color_matches * 5 + color_matches
+
+
+if __name__ == '__main__':
+    main()
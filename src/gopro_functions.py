@@ -28,6 +28,7 @@
 import os
 import sys
 import argparse
+import subprocess
 import configparser
 
 
@@ -44,6 +45,27 @@ def environment(
     return args, config, dict(ffmpeg=ffmpeg)
 
 
+def can_encode(
+        ffmpeg: str,
+        encoder: str
+) -> bool:
+    """Check whether the given encoder, such as h264_nvenc, works here by encoding a single test frame"""
+    # ffmpeg builds list hardware encoders even where the hardware is missing, so only an encode tells
+    try:
+        result = subprocess.run(
+            [
+                ffmpeg, '-hide_banner', '-loglevel', 'error',
+                '-f', 'lavfi', '-i', 'color=s=256x256',
+                '-frames:v', '1', '-c:v', encoder, '-f', 'null', '-'
+            ],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL
+        )
+    except OSError:
+        return False
+    return result.returncode == 0
+
+
 def ask_go(
         target: str,
         replace_default: str
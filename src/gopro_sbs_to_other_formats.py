@@ -28,36 +28,68 @@
 # left/right version for stereoscopes (inexpensive viewers into which
 # one generally slides a cellphone player.) The stereoscope will have
 # a black center gap to help separate the two images. Its width is
-# configurable.
+# configurable; the gap is left black by the fill option of the xstack
+# filter (ffmpeg 4.4 or later.) All formats for one video are produced
+# by a single ffmpeg process, which splits the decoded stream, so each
+# source is decoded once.
+# Several sources are converted concurrently (option --jobs) once all
+# questions about replacing existing files have been answered. Targets
+# that are newer than their source are skipped unless --force is given.
+#
+# If a one-frame test encode with h264_nvenc succeeds, the source is
+# decoded on the GPU and the outputs are encoded with h264_nvenc, one
+# source at a time unless --jobs says otherwise. The filters stay on the
+# CPU, as stereo3d and xstack have no GPU counterparts. Use --no_hwaccel
+# to force the software path.
 #
 # The folder and width of the stereoscopic center gap are either taken
 # from the command line, or from a config file ~/whimsical_recipes,
 # section [GoPro Dual Hero3]. See below in the function __settings() for
 # details.
 #
-# The red/cyan anaglyph is generated with explicit pixel format yuv420p.
-# The filter stereo3d produces yuv444p, which couldn't be viewed in
-# QuickTime on my MacBook Pro.
+# The red/cyan anaglyph is generated with explicit pixel format yuv420p,
+# requested inside the filter graph. The filter stereo3d produces RGB,
+# which would otherwise be encoded as yuv444p, which couldn't be viewed
+# in QuickTime on my MacBook Pro.
 
 
 import os
 import re
+import shlex
 import subprocess
 import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+from gopro_functions import ask_go, environment, can_encode
+
 
-from gopro_functions import ask_go, environment
+# Threads per ffmpeg process: the decoder and the filter graph get as many, and the encoders
+# of its outputs share them. Decoding, filtering and encoding are stages of one pipeline, so a
+# process keeps about this many cores busy; the default number of concurrent jobs divides the
+# cores by it
+FFMPEG_THREADS = 4
+
+# Decoder and encoder options for NVIDIA GPUs, used if NVENC works on this machine
+NVENC_INPUT_OPTIONS = ['-hwaccel', 'cuda']
+# Without -b:v 0, the -cq quality target would still be capped by the default bitrate of 2 Mbit/s
+NVENC_OUTPUT_OPTIONS = ['-c:v', 'h264_nvenc', '-preset', 'p4', '-rc', 'vbr', '-cq', '23', '-b:v', '0']
+
+# Expected naming scheme of rendered side-by-side movies: <anything>(SbS).<extension>
+SBS_PATTERN = re.compile(r'^([^\(]+)\(SbS\)(\.\w+)$')
 
 
 def main() -> None:
     """Find all side-by-side rendered movies and convert them to anaglyph and stereoscopic formats"""
-    common, folder, stereoscope_center_gap = __settings()
+    common, folder, stereoscope_center_gap, jobs, force = __settings()
     sources = __sources(folder)
     replace_default = None
+    commands = []
     for source, parts in sources.items():
+        outputs = []
         for tag, action in [
-            ('Anaglyph', __go_anaglyph),
-            ('Stereoscope',  __go_stereoscope),
-            (None, __go_mono)
+            ('Anaglyph', __anaglyph),
+            ('Stereoscope',  __stereoscope),
+            (None, __mono)
         ]:
             if tag is not None:
                 target = '{}{}({}){}'.format(folder, parts[0], tag, parts[1])
@@ -67,14 +99,28 @@ def main() -> None:
                     ending = ending[:-3]
                 target = '{}{}{}'.format(folder, ending, parts[1])
             print('Propose {} -> {}'.format(source, target))
+            if not force and __up_to_date(source, target):
+                print('Up to date, skipping.')
+                print('')
+                continue
             go, replace_default = ask_go(target, replace_default)
             if go:
-                if action(common['ffmpeg'], source, target, stereoscope_center_gap) != 0:
-                    print('Error -- aborting')
-                    break
+                outputs.append((action, target))
             else:
                 print('Skipping.')
             print('')
+        if outputs:
+            # All formats are produced by one ffmpeg process, so the source is decoded only once
+            commands.append(__command(common, source, outputs, stereoscope_center_gap))
+    if commands:
+        # All questions have been answered, the conversions can now run unattended side by side
+        print('Converting.')
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            for result in executor.map(__go, commands):
+                if result != 0:
+                    print('Error -- aborting')
+                    executor.shutdown(cancel_futures=True)
+                    break
 
 
 def __settings() -> tuple:
@@ -88,7 +134,23 @@ def __settings() -> tuple:
         type=int,
         help='gap in pixels between left and right sides'
     )
+    arg_parser.add_argument(
+        '--jobs',
+        type=int,
+        help='number of sources converted concurrently'
+    )
+    arg_parser.add_argument(
+        '--no_hwaccel',
+        action='store_true',
+        help='do not decode and encode on an NVIDIA GPU even if one is available'
+    )
+    arg_parser.add_argument(
+        '--force',
+        action='store_true',
+        help='also convert sources whose targets are newer than the source'
+    )
     args, config, common = environment(arg_parser)
+    common['nvenc'] = not args.no_hwaccel and can_encode(common['ffmpeg'], 'h264_nvenc')
     if args.folder is None:
         root = config.get('SideBySideSourceRoot', '')
         folder = '{}/{}'.format(root, input('Side-by-side input folder: {}/'.format(root)))
@@ -100,96 +162,129 @@ def __settings() -> tuple:
     else:
         stereoscope_center_gap = args.stereoscope_center_gap
     stereoscope_center_gap = stereoscope_center_gap // 8 * 8
-    print('Folder = {}\nStereoscopeCenterGap = {}'.format(folder, stereoscope_center_gap))
-    return common, folder, stereoscope_center_gap
+    if args.jobs is not None:
+        jobs = args.jobs
+    elif 'Jobs' in config:
+        jobs = int(config['Jobs'])
+    elif common['nvenc']:
+        # Consumer GPUs limit the number of concurrent NVENC sessions, so GPU jobs run one at a time
+        jobs = 1
+    else:
+        jobs = (os.cpu_count() or 1) // FFMPEG_THREADS
+    jobs = max(1, jobs)
+    print('Folder = {}\nStereoscopeCenterGap = {}\nJobs = {}\nNVENC = {}'.format(
+        folder,
+        stereoscope_center_gap,
+        jobs,
+        common['nvenc']
+    ))
+    return common, folder, stereoscope_center_gap, jobs, args.force
 
 
 def __sources(
         folder: str
 ) -> dict:
     """Derive names of target movies from names of input side-by-side files with expected naming scheme"""
-    files = sorted(os.listdir(folder))
-    sources = dict()
-    for file in files:
-        # Expected naming scheme of rendered side-by-side movies: <anything>(sBs).<extension>
-        m = re.match(r'^([^\(]+)\(SbS\)(\.\w+)$', file)
-        if m:
-            prefix, suffix = m.group(1), m.group(2)
-            sources['{}{}'.format(folder, file)] = (prefix, suffix)
-    return sources
-
-
-def __go_anaglyph(
-        ffmpeg: str,
+    with os.scandir(folder) as entries:
+        matches = [
+            (entry.name, m) for entry in entries
+            if entry.is_file() and (m := SBS_PATTERN.match(entry.name))
+        ]
+    # File names are unique, so sorting never compares the match objects
+    matches.sort()
+    return {'{}{}'.format(folder, file): m.groups() for file, m in matches}
+
+
+def __up_to_date(
         source: str,
-        target: str,
-        *_
-) -> int:
-    """Use ffmpeg to convert the source file to red/cyan anaglyph format"""
-    print('Converting.')
+        target: str
+) -> bool:
+    """Check whether the target has been written after the source was last modified"""
+    return os.path.exists(target) and os.path.getmtime(target) >= os.path.getmtime(source)
+
+
+def __command(
+        common: dict,
+        source: str,
+        outputs: list,
+        stereoscope_center_gap: int
+) -> list:
+    """Make the ffmpeg command line that converts the source file to all requested formats in a single pass"""
+    # Split the decoded video once into one branch per output format
+    graph = ['[0:v]split={}{}'.format(len(outputs), ''.join('[s{}]'.format(i) for i in range(len(outputs))))]
+    maps = []
+    for i, (action, target) in enumerate(outputs):
+        filters, options = action('s{}'.format(i), 'v{}'.format(i), stereoscope_center_gap)
+        if common['nvenc']:
+            options = options + NVENC_OUTPUT_OPTIONS
+        graph.append(filters)
+        # The audio is not filtered, and targets share the container of the source, so copy it as is
+        maps += [
+            '-map', '[v{}]'.format(i), '-map', '0:a',
+            '-c:a', 'copy',
+            '-threads', str(max(1, FFMPEG_THREADS // len(outputs)))
+        ] + options + [target]
     steps = [
         '-y',
-        '-hide_banner -loglevel warning',
-        '-i "{}"'.format(source),
-        '-filter_complex',
-        '"[0:v]stereo3d=sbs2l:arcg,scale=w=2*iw:h=ih,setsar=1[v]"',
-        '-map "[v]" -map "0:a"',
-        '-pix_fmt yuv420p'
-    ]
-    command = '{} {} "{}"'.format(ffmpeg, ' '.join(steps), target)
-    print(command)
-    return subprocess.call(command, shell=True)
-
-
-def __go_stereoscope(
-        ffmpeg: str,
+        '-hide_banner', '-loglevel', 'warning'
+    ] + (NVENC_INPUT_OPTIONS if common['nvenc'] else []) + [
+        '-threads', str(FFMPEG_THREADS),
+        '-i', source,
+        '-filter_complex_threads', str(FFMPEG_THREADS),
+        '-filter_complex', ';'.join(graph)
+    ] + maps
+    return [common['ffmpeg']] + steps
+
+
+def __go(
+        command: list
+) -> int:
+    """Run one ffmpeg command line; no shell is involved, so file names need no quoting"""
+    print(shlex.join(command))
+    return subprocess.run(command, check=False).returncode
+
+
+def __anaglyph(
+        source: str,
+        target: str,
+        *_
+) -> tuple:
+    """Make the ffmpeg filter and output options that convert a side-by-side stream to red/cyan anaglyph format"""
+    # stereo3d works in RGB; requesting yuv420p right after the scale lets the scale filter convert
+    # and upscale in a single pass
+    filters = '[{}]stereo3d=sbs2l:arcg,scale=w=2*iw:h=ih,format=yuv420p,setsar=1[{}]'.format(source, target)
+    return filters, []
+
+
+def __stereoscope(
         source: str,
         target: str,
         stereoscope_center_gap: int
-) -> int:
-    """Use ffmpeg to convert the source file to stereoscope format"""
-    print('Converting.')
+) -> tuple:
+    """Make the ffmpeg filter and output options that convert a side-by-side stream to stereoscope format"""
     quarter_gap = stereoscope_center_gap // 8
-    steps = [
-        '-y',
-        '-hide_banner -loglevel warning',
-        '-i "{}"'.format(source),
-        '-filter_complex',
-        '"[0:v]crop=iw/4:ih:iw/8+{}:0,fillborders=right={}:mode=fixed,scale=w=2*iw:h=ih,setsar=1[left];'.format(
-            quarter_gap,
-            quarter_gap * 2
-        ),
-        '[0:v]crop=iw/4:ih:5*iw/8-{}:0,fillborders=left={}:mode=fixed,scale=w=2*iw:h=ih,setsar=1[right];'.format(
-            quarter_gap,
-            quarter_gap * 2
-        ),
-        '[left][right]hstack[v]"',
-        '-map "[v]" -map "0:a"'
-    ]
-    command = '{} {} "{}"'.format(ffmpeg, ' '.join(steps), target)
-    print(command)
-    return subprocess.call(command, shell=True)
-
-
-def __go_mono(
-        ffmpeg: str,
+    # Crop the strips without the gap and let xstack leave the gap black, rather than painting it with
+    # fillborders, and scale once after stacking
+    filters = ';'.join([
+        '[{0}]split[{1}l][{1}r]'.format(source, target),
+        '[{}l]crop=iw/4-{}:ih:iw/8+{}:0[{}left]'.format(target, quarter_gap * 2, quarter_gap, target),
+        '[{}r]crop=iw/4-{}:ih:5*iw/8+{}:0[{}right]'.format(target, quarter_gap * 2, quarter_gap, target),
+        '[{0}left][{0}right]xstack=inputs=2:layout=0_0|w0+{1}_0:fill=black,scale=w=2*iw:h=ih,setsar=1[{0}]'.format(
+            target,
+            quarter_gap * 4
+        )
+    ])
+    return filters, []
+
+
+def __mono(
         source: str,
         target: str,
         *_
-) -> int:
-    """Use ffmpeg to convert the source file to stereoscope format"""
-    print('Converting.')
-    steps = [
-        '-y',
-        '-hide_banner -loglevel warning',
-        '-i "{}"'.format(source),
-        '-filter_complex',
-        '"[0:v]crop=iw/2:ih:0:0,scale=w=2*iw:h=ih,setsar=1[v]"',
-        '-map "[v]" -map "0:a"'
-    ]
-    command = '{} {} "{}"'.format(ffmpeg, ' '.join(steps), target)
-    print(command)
-    return subprocess.call(command, shell=True)
+) -> tuple:
+    """Make the ffmpeg filter and output options that extract the left side of a side-by-side stream"""
+    filters = '[{}]crop=iw/2:ih:0:0,scale=w=2*iw:h=ih,setsar=1[{}]'.format(source, target)
+    return filters, []
 
 
 main()
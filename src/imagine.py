@@ -24,6 +24,9 @@
 # the global namespace of functions and class methods. It's not advisable to use it for large software
 # systems. I'd view it as an intellectual exercise only.
 #
+# "with" contexts are tracked per thread: scenes activated in one thread don't leak into code running
+# in other threads.
+#
 # See test/imagine_test.py for more complex test cases, including ones that use dynamic embedding of
 # multiple stacks of scenes, and tests involving more than one function.
 #
@@ -79,13 +82,24 @@
 #        print(g(0))  # prints 1
 
 
+import functools
+import threading
+from collections import OrderedDict
 from typing import Any, Union
-from copy import copy
-from types import FunctionType, LambdaType
-from contextlib import AbstractContextManager
+from types import FunctionType
+
+
+# Marks the absence of an imagined value in lookups
+_MISSING = object()
+
+# Number of dynamic embeddings remembered per stack of scenes
+_EMBEDDED_CACHE_SIZE = 16
 
+# Number of results remembered per memoized function or method
+_MEMOIZE_CACHE_SIZE = 1024
 
-def imagine(body: FunctionType) -> FunctionType:
+
+def imagine(body: FunctionType = None, *, memoize: bool = False) -> FunctionType:
     """
     Decorate a function for which imagined mappings can then be defined.
     If f is the decorated function or method, we can then compute function values
@@ -106,13 +120,25 @@ def imagine(body: FunctionType) -> FunctionType:
     of altered scenes. Think of below as a thought experiment. Be careful when using it as
      a design principle in larger software systems.
 
+    Pure functions can have their results remembered for calls outside of any "with" context::
+
+        @imagine(memoize=True)
+        def f(x):
+            return x + 1
+
     :param body: function or method to be decorated
+    :param memoize: if True, remember the results of the most recent calls with hashable arguments
+    made while no imagined scenes are active, for any function; the original must then not depend
+    on anything but its arguments. The cache holds strong references to the arguments, including
+    "self" for methods, which keeps those instances alive
     :returns: a wrapper function with new methods 'at', 'imagine', and the ability to backtrack
     """
-    return _Runtime(body)
+    if body is None:
+        return functools.partial(imagine, memoize=memoize)
+    return _Runtime(body, memoize)
 
 
-class _Cursor:
+class _Cursor(threading.local):
     """
     A helper class for a shared object holding the top pointer and its history,
     into the stack of overrides. Imagined "scenes" pushed onto the stack are
@@ -127,11 +153,15 @@ class _Cursor:
     function or method is modified to consult the overrides. This temporary change dynamically
     applies globally, in the entire code space. The temporary changes are "injected" into the
     function or method.
+
+    The top pointer and its history are kept per thread: "with" contexts entered in one thread
+    are not visible in others, so threads can imagine different scenes concurrently. This class
+    has no __slots__, as threading.local keeps the attributes of each thread in a separate __dict__.
     """
 
     def __init__(self) -> None:
         """
-        Initialize top pointer to None.
+        Initialize top pointer to None. Called again in each thread that uses the cursor.
         """
         self.top = []
 
@@ -140,82 +170,56 @@ class _Cursor:
         """
         Convenience function to access the currently active set of scenes.
 
-        :return: the top scene pointer for the "with" context currently activec
+        :return: the stack of scenes for the "with" context currently activec
         """
         return self.top[-1] if self.top else None
 
 
-class _Scene:
+class _Contexts(threading.local):
     """
-    A helper class holding one assignment, or "scene", containing a new, temporary mapping of a point
-    in parameter space to a value. Scenes are stored in a singly-linked list.
+    A helper class counting the "with" contexts active in the current thread, across all
+    decorated functions and methods. Memoized results are neither used nor remembered while
+    any context is active, since the original may call other functions whose values are imagined.
     """
 
-    def __init__(self, parent: Union['_Scene, None'], guard: Union[FunctionType, LambdaType, None], value: Any):
-        """
-        Scenes are linked in a singly-linked list.
-
-        :param parent: the previous scene, or None if this is the same scene for this function or method
-        :param guard: a function checking arguments, returning True oif the override holds for them; None
-        means the override holds everywhere
-        :param value: the override value
-        """
-        self.__parent = parent
-        self.__guard = guard
-        self.__value = value
-
-    def applies(self, *args, **kwargs) -> bool:
-        """
-        An oracle that returns True if the passed-in arguments, positional and keyword, identify the point
-        or sub-space for which an override is defined.
-
-        :param args: the positional components of the point in parameter space for which
-        an override is defined
-        :param kwargs: the keyword components of the point in parameter space for which
-        an override is defined
-        :return: True if this is the imagined point, False otherwise
+    def __init__(self) -> None:
         """
-        return self.__guard is None or self.__guard(*args, **kwargs)
-
-    def copy_with_parent(self, parent: Union['_Scene, None']) -> '_Scene':
+        Initialize the count to zero. Called again in each thread that uses the counter.
         """
-        Create a copy of self, with the parent pointer redirected so alternative, larger stacks
-        of scenes can be created.
+        self.active = 0
 
-        :param parent: the new parent pointer
-        :return: the new scene
-        """
-        return _Scene(parent, self.__guard, self.__value)
 
-    @property
-    def value(self):
-        """
-        Accessor.
+_CONTEXTS = _Contexts()
 
-        :return: the value
-        """
-        return self.__value
 
-    @property
-    def parent(self):
-        """
-        Accessor
+def _key(args: tuple, kwargs: dict) -> tuple:
+    """
+    Canonical, hashable form of a point in parameter space, if all its components are hashable.
+    Keyword arguments are sorted so that the order in which they are passed does not matter.
 
-        :return: the parent or None
-        """
-        return self.__parent
+    :param args: the positional components of the point
+    :param kwargs: the keyword components of the point
+    :return: a tuple that compares equal for equal points
+    """
+    return args, tuple(sorted(kwargs.items())) if kwargs else ()
 
 
 class _At:
     """
     A helper class that separates the definition of the point in parameter space for
     which we define an override from the announcement of the override value. We can
-    think of an override action as adding a "scene" consisting of a "guard" and a
-    "value." An instance of "_At" embodies a guard that checks for a particular
-    point. We can picture guards that check for ranges or other types of sub-domains.
+    think of an override action as adding a "scene" consisting of a "key" and a
+    "value." An instance of "_At" embodies the key of a particular point. We can
+    picture scenes that hold for ranges or other types of sub-domains.
+
+    A scene is a tuple (key, value): key is the canonical form of the point for which
+    the override holds, see _key(), or None if the override holds everywhere. Calls
+    compare their own key with it, using __eq__ to test equality.
     """
 
-    def __init__(self, cursor: _Cursor, top: _Scene, *args, **kwargs) -> None:
+    __slots__ = ('__cursor', '__scenes', '__key')
+
+    def __init__(self, cursor: _Cursor, scenes: tuple, *args, **kwargs) -> None:
         """
         An instance of 'At' is used to freeze a point in parameter space for which we
         imagine a different mapping, replacing any calculated function value. This
@@ -229,17 +233,17 @@ class _At:
 
         :param cursor: the shared object holding pointers used for managing stack positions;
         updated with global effect as "with" contexts are entered and exited
-        :param top: the top of the scene stack at the time we identify the point in parameter
-        space for which a new imagined value is defined
+        :param scenes: the stack of scenes at the time we identify the point in parameter
+        space for which a new imagined value is defined, bottom first
         :param args: the positional components of the point in parameter space for which
         an override is defined
         :param kwargs: the keyword components of the point in parameter space for which
         an override is defined
         """
         self.__cursor = cursor
-        self.__top = top
-        self.__args = args
-        self.__kwargs = kwargs
+        self.__scenes = scenes
+        # Canonical form computed once, however many values are imagined for the point
+        self.__key = _key(args, kwargs)
 
     def imagine(self, value: Any) -> '_Imagine':
         """
@@ -252,33 +256,87 @@ class _At:
         :param value: value of any type
         :return: a context exit handler that pops the value off the stack of scenes
         """
-        def guard(*args, **kwargs) -> bool:
-            # We use __eq__ to test equality
-            return args == self.__args and kwargs == self.__kwargs
-
-        return _Imagine(self.__cursor, _Scene(self.__top, guard, value))
+        return _Imagine(self.__cursor, self.__scenes + ((self.__key, value),))
 
 
-class _Imagine(AbstractContextManager):
+class _Imagine:
     """
     A helper class that holds the temporary assignment of a point or otherwise
     defined sub-space in parameter space to an alternate value. "_Imagine" completes
     "_At." This helper class is also responsible for popping off the temporary
     assignment when the enclosing "with" context ends.
+
+    Like _ImagineMany, this class doesn't derive from AbstractContextManager, which has no
+    __slots__; it is still recognized as a context manager by isinstance().
     """
 
-    def __init__(self, cursor: _Cursor, top: _Scene) -> None:
+    __slots__ = ('__cursor', '__scenes', '__index', '__embedded')
+
+    def __init__(self, cursor: _Cursor, scenes: tuple) -> None:
         """
         Used inside a "with" context, pushes a new override value, and turns on and
         removes temporary scenes from the stack of scenes as "with" contexts are entered
         and exited.
 
         :param cursor: the shared object holding pointers used for managing stack positions
-        :param top: the top of the scene stack at the time we identify the point in parameter
-        space for which a new imagined value is defined
+        :param scenes: the stack of scenes, bottom first, including the new imagined value; stacks
+        are never modified, new scenes are added to copies
         """
         self.__cursor = cursor
-        self.__top = top
+        self.__scenes = scenes
+        self.__index = None
+        self.__embedded = None
+
+    @property
+    def scenes(self) -> tuple:
+        """
+        Accessor.
+
+        :return: the stack of scenes, bottom first
+        """
+        return self.__scenes
+
+    @property
+    def index(self) -> tuple:
+        """
+        A hash index over the stack of scenes, so lookups don't have to consult the scenes one
+        by one. The stack is never modified, so the index is built once, on first use. Points
+        with unhashable components can't be hashed; they are kept apart in a short list. Calls
+        with unhashable arguments, and all calls while that list is not empty, walk the scenes
+        instead, see find(), since unhashable and hashable components may still compare equal.
+
+        :return: a dictionary mapping the keys of points to the value of the topmost scene for that
+        point, the keys and values of scenes with unhashable points, topmost first, and the value
+        of the topmost scene that holds everywhere, or _MISSING; scenes below that one are shadowed
+        and not indexed
+        """
+        if self.__index is None:
+            points = dict()
+            unhashable = []
+            everywhere = _MISSING
+            for key, value in reversed(self.__scenes):
+                if key is None:
+                    everywhere = value
+                    break
+                try:
+                    points.setdefault(key, value)
+                except TypeError:
+                    unhashable.append((key, value))
+            self.__index = points, tuple(unhashable), everywhere
+        return self.__index
+
+    def find(self, key: tuple) -> Any:
+        """
+        Walk the stack of scenes topmost first, comparing points with __eq__ only, for keys
+        the hash index can't serve. Unhashable arguments may still equal hashable points.
+
+        :param key: the canonical form of the point of a call, see _key()
+        :return: the value of the topmost scene that holds for the point, or _MISSING
+        """
+        for point, value in reversed(self.__scenes):
+            if point is None or point == key:
+                return value
+        return _MISSING
 
     def at(self, *args, **kwargs) -> _At:
         """
@@ -296,7 +354,7 @@ class _Imagine(AbstractContextManager):
         an override is defined
         :return: a helper object on which we can call 'imagine' in order to define the override
         """
-        return _At(self.__cursor, self.__top, *args, **kwargs)
+        return _At(self.__cursor, self.__scenes, *args, **kwargs)
 
     def dynamically_embedded(self) -> '_Imagine':
         """
@@ -305,22 +363,27 @@ class _Imagine(AbstractContextManager):
         to w1 will remove all temporary changes of w1. This can be changed bvy creating a dynamically
         embedded copy of w2 inside the "with" context bound to w1.
 
+        The embedding only depends on the stack of scenes currently active, so the most recent ones
+        are remembered, along with their hash indexes, for stacks that are embedded repeatedly. The
+        least recently used embedding is forgotten first.
+
         :return: a new "_Imagine" object that consists of a concatenation of the stack of scenes of
         self, with the stack of scenes currently active globally
         """
         if not self.__cursor.top:
             return self
-
-        def traverse():
-            p = self.__top
-            while p is not None:
-                yield p
-                p = p.parent
-
-        top = self.__cursor.current
-        for q in reversed(list(traverse())):
-            top = q.copy_with_parent(top)
-        return _Imagine(self.__cursor, top)
+        current = self.__cursor.current
+        if self.__embedded is None:
+            self.__embedded = OrderedDict()
+        embedded = self.__embedded.get(current)
+        if embedded is None:
+            embedded = _Imagine(self.__cursor, current.__scenes + self.__scenes)
+            self.__embedded[current] = embedded
+            if len(self.__embedded) > _EMBEDDED_CACHE_SIZE:
+                self.__embedded.popitem(last=False)
+        else:
+            self.__embedded.move_to_end(current)
+        return embedded
 
     def __add__(self, other: Union['_Imagine', '_ImagineMany']) -> '_ImagineMany':
         """
@@ -336,11 +399,12 @@ class _Imagine(AbstractContextManager):
     def __enter__(self) -> '_Imagine':
         """
         Turns on recently added imagined values by moving the global top pointer of the shared cursor
-        object to the top constructed during the assembly of "_At" and "_Imagine" objects.
+        object to the stack constructed during the assembly of "_At" and "_Imagine" objects.
 
         :return: self
         """
-        self.__cursor.top.append(self.__top)
+        self.__cursor.top.append(self)
+        _CONTEXTS.active += 1
         return self
 
     def __exit__(self, *_) -> None:
@@ -353,20 +417,29 @@ class _Imagine(AbstractContextManager):
         :return: None
         """
         self.__cursor.top.pop()
+        _CONTEXTS.active -= 1
 
 
-class _ImagineMany(AbstractContextManager):
+class _ImagineMany:
     """
     A helper class that holds the temporary assignments for many functions or methods.
     """
 
+    __slots__ = ('__components',)
+
     def __init__(self, *components) -> None:
         """
-        Record the overrides that should be applied together in "with" compound statements.
+        Record the overrides that should be applied together in "with" compound statements. Nested
+        sets are flattened here, once, so entering and exiting contexts is a simple loop.
 
         :param components: a list of function/method overrides, either of type _Imagine or _ImagineMany
         """
-        self.__components = list(components)
+        self.__components = []
+        for component in components:
+            if isinstance(component, _Imagine):
+                self.__components.append(component)
+            else:
+                self.__components.extend(component.__components)
 
     def dynamically_embedded(self) -> '_ImagineMany':
         """
@@ -377,7 +450,7 @@ class _ImagineMany(AbstractContextManager):
 
         :return: a new "_ImagineMany" object that performs the dynamic embed for all of its components
         """
-        return _ImagineMany(*[component.dynamically_embedded() for component in self.__traverse_forward()])
+        return _ImagineMany(*[component.dynamically_embedded() for component in self.__components])
 
     def __add__(self, other: Union[_Imagine, '_ImagineMany']) -> '_ImagineMany':
         """
@@ -395,7 +468,7 @@ class _ImagineMany(AbstractContextManager):
 
         :return: self
         """
-        for component in self.__traverse_forward():
+        for component in self.__components:
             component.__enter__()
         return self
 
@@ -407,37 +480,9 @@ class _ImagineMany(AbstractContextManager):
         :param _: ignored, what we do is unconditional
         :return: None
         """
-        for component in self.__traverse_backward():
+        for component in reversed(self.__components):
             component.__exit__(*_)
 
-    def __traverse_forward(self):
-        """
-        Helper function to traverse all concatenated components non-recursively, depth-first, left-to-right.
-
-        :return: iterator for traversal
-        """
-        work = copy(self.__components)
-        while work:
-            component = work.pop()
-            if isinstance(component, _Imagine):
-                yield component
-            else:
-                work.extend(component.__components)
-
-    def __traverse_backward(self):
-        """
-        Helper function to traverse all concatenated components non-recursively, depth-first, right-to-left.
-
-        :return: iterator for traversal
-        """
-        work = list(reversed(self.__components))
-        while work:
-            component = work.pop()
-            if isinstance(component, _Imagine):
-                yield component
-            else:
-                work.extend(list(reversed(component.__components)))
-
 
 class _Runtime:
     """
@@ -449,14 +494,29 @@ class _Runtime:
     context is exited.
     """
 
-    def __init__(self, body: FunctionType) -> None:
+    # __dict__ holds the metadata copied from the decorated function or method
+    __slots__ = ('__body', '__memoized', '__cursor', '__dict__')
+
+    def __init__(self, body: FunctionType, memoize: bool = False) -> None:
         """
         Initialize wrapper class with original function or method, and prepare stack
         of pretend mappings. Stack frames are created and removed inside with contexts.
+        The wrapper takes on the name, docstring and signature of the original, which
+        remains reachable as __wrapped__, for the benefit of help(), inspect and profilers.
 
         :param body: original function or method for which new mappings can be defined
+        :param memoize: if True, remember results of the original, see imagine()
         """
+        functools.update_wrapper(self, body)
         self.__body = body
+        self.__memoized = None
+        if memoize:
+            @functools.lru_cache(maxsize=_MEMOIZE_CACHE_SIZE)
+            def memoized(key: tuple) -> Any:
+                args, kwargs = key
+                return body(*args, **dict(kwargs))
+
+            self.__memoized = memoized
         self.__cursor = _Cursor()
 
     def __getitem__(self, backtrack: int) -> '_Runtime':
@@ -476,6 +536,7 @@ class _Runtime:
         if backtrack == -1:
             return self
         stack = _Runtime(self.__body)
+        stack.__memoized = self.__memoized
         stack.__cursor.top = self.__cursor.top[0:backtrack + 1]
         return stack
 
@@ -483,17 +544,38 @@ class _Runtime:
         """
         Before calling the original function or methods, go through the stack of scenes
         and try to find a temporary, "imagined" value for (*args, **kwargs). If none exist
-        we proceed and evaluate the original. Scenes are consulted in LIFO order.
+        we proceed and evaluate the original. Scenes are consulted in LIFO order, through
+        the hash index of the active stack if the arguments and all points are hashable.
 
         :param args: positional arguments, including "self" if we decorated a method
         :param kwargs: keyword arguments
         :return: the imagined mapping, or the value yielded by the evaluation of the original
         """
-        p = self.__cursor.current
-        while p is not None:
-            if p.applies(*args, **kwargs):
-                return p.value
-            p = p.parent
+        top = self.__cursor.top
+        if not top:
+            # Outside of any "with" context for this function, as in most calls
+            if self.__memoized is not None and not _CONTEXTS.active:
+                key = _key(args, kwargs) if kwargs else (args, ())
+                try:
+                    hash(key)
+                except TypeError:
+                    pass
+                else:
+                    return self.__memoized(key)
+            return self.__body(*args, **kwargs)
+        p = top[-1]
+        points, unhashable, everywhere = p.index
+        key = _key(args, kwargs) if kwargs else (args, ())
+        if unhashable:
+            # Unhashable points may equal hashable arguments, and shadow indexed points below them
+            value = p.find(key)
+        else:
+            try:
+                value = points.get(key, everywhere)
+            except TypeError:
+                value = p.find(key)
+        if value is not _MISSING:
+            return value
         return self.__body(*args, **kwargs)
 
     def at(self, *args, **kwargs) -> _At:
@@ -513,7 +595,7 @@ class _Runtime:
         :param kwargs: the keyword components in the parameter space for which we define a new value
         :return: a class object with one useful method: "imagine"
         """
-        return _At(self.__cursor, self.__cursor.current, *args, **kwargs)
+        return _At(self.__cursor, self.__cursor.current.scenes if self.__cursor.top else (), *args, **kwargs)
 
     def imagine(self, value: Any) -> _Imagine:
         """
@@ -524,4 +606,5 @@ class _Runtime:
         :param value: new value to substitute throughout
         :return: a helper object used by the context manager to pop imagined scenes
         """
-        return _Imagine(self.__cursor, _Scene(self.__cursor.current, None, value))
+        scenes = self.__cursor.current.scenes if self.__cursor.top else ()
+        return _Imagine(self.__cursor, scenes + ((None, value),))
@@ -24,7 +24,9 @@
 # the global namespace of functions and class methods. It's not advisable to use it for large software
 # systems. I'd view it as an intellectual exercise only.
 
+import inspect
 import unittest
+import threading
 
 from imagine import imagine
 
@@ -139,6 +141,10 @@ class TestImagine(unittest.TestCase):
             with w21:
                 # w11 inherits all overrides currently active
                 self.assertEqual((f(1), f(2), f(3)), (2, -2, 4))
+            # the embedding only depends on the overrides currently active
+            self.assertIs(w2.dynamically_embedded(), w21)
+            with w21:
+                self.assertIsNot(w2.dynamically_embedded(), w21)
             self.assertEqual((f(1), f(2), f(3)), (2, -2, -3))
         self.assertEqual((f(1), f(2), f(3)), (-1, -2, -3))
 
@@ -206,6 +212,123 @@ class TestImagine(unittest.TestCase):
             self.assertEqual((f(1), g(2), h(3)), (3, 2, 1))
         self.assertEqual((f(1), g(2), h(3)), (-1, 3, 6))
 
+    def test_points(self):
+        """
+        Verify that points are told apart by positional and keyword components, irrespective of the
+        order of keywords and of whether the components are hashable, that hashable and unhashable
+        components which are equal match each other, and that an override that holds everywhere
+        shadows the points below it.
+
+        :return: None
+        """
+
+        @imagine
+        def f(x, y=0):
+            return len(x) if isinstance(x, list) else x + y
+
+        self.assertEqual((f(1), f(1, y=1), f([1, 2])), (1, 2, 2))
+        with f.at(1).imagine(3).at(1, y=1).imagine(4).at([1, 2]).imagine(5):
+            self.assertEqual((f(1), f(1, y=1), f([1, 2]), f([1])), (3, 4, 5, 1))
+            with f.at(1, y=1, z=2).imagine(6):
+                self.assertEqual(f(1, z=2, y=1), 6)
+                with f.imagine(7).at(1).imagine(8):
+                    self.assertEqual((f(1), f(1, y=1), f([1, 2]), f(1, y=1, z=2)), (8, 7, 7, 7))
+        self.assertEqual((f(1), f(1, y=1), f([1, 2])), (1, 2, 2))
+
+        class U:
+            __hash__ = None
+
+            def __init__(self, x):
+                self.x = x
+
+            def __eq__(self, other):
+                return self.x == (other.x if isinstance(other, U) else other)
+
+        with f.at(1).imagine(3):
+            self.assertEqual(f(U(1)), 3)
+            with f.imagine(7).at([1, 2]).imagine(8):
+                self.assertEqual((f(U(1)), f([1, 2])), (7, 8))
+        with f.at(2).imagine(3).at(U(2)).imagine(4):
+            self.assertEqual((f(2), f(U(2)), f(1)), (4, 4, 1))
+
+    def test_threads(self):
+        """
+        Verify that the scenes imagined in one thread are not visible in another.
+
+        :return: None
+        """
+
+        @imagine
+        def f(x):
+            return -x
+
+        seen = dict()
+
+        def run():
+            seen['before'] = f(1)
+            with f.at(1).imagine(3):
+                seen['inside'] = f(1)
+
+        with f.at(1).imagine(2):
+            thread = threading.Thread(target=run)
+            thread.start()
+            thread.join()
+            self.assertEqual(f(1), 2)
+        self.assertEqual(seen, dict(before=-1, inside=3))
+
+    def test_metadata(self):
+        """
+        Verify that the decorated function keeps the name, docstring and signature of the original.
+
+        :return: None
+        """
+
+        def f(x, y=0):
+            """Add."""
+            return x + y
+
+        g = imagine(f)
+        self.assertEqual((g.__name__, g.__doc__), ('f', 'Add.'))
+        self.assertIs(inspect.unwrap(g), f)
+        self.assertEqual(inspect.signature(g), inspect.signature(f))
+        self.assertEqual(g[-2].__name__, 'f')
+
+    def test_memoize(self):
+        """
+        Verify that memoized results are reused outside of "with" contexts only, for any function.
+
+        :return: None
+        """
+
+        calls = []
+
+        @imagine(memoize=True)
+        def f(x, y=0):
+            calls.append(x)
+            return -x - y
+
+        self.assertEqual((f(1), f(1), f(1, y=1), f(1, y=1)), (-1, -1, -2, -2))
+        self.assertEqual(calls, [1, 1])
+        with f.at(1).imagine(2):
+            self.assertEqual((f(1), f(2), f(2)), (2, -2, -2))
+            self.assertEqual(f[-2](1), -1)
+        self.assertEqual(calls, [1, 1, 2, 2, 1])
+        self.assertEqual((f(2), f(2)), (-2, -2))
+        self.assertEqual(calls, [1, 1, 2, 2, 1, 2])
+
+        @imagine
+        def g(x):
+            return x
+
+        @imagine(memoize=True)
+        def h(x):
+            return g(x) + 1
+
+        self.assertEqual(h(2), 3)
+        with g.at(1).imagine(10), g.at(2).imagine(20):
+            self.assertEqual((h(1), h(2)), (11, 21))
+        self.assertEqual((h(1), h(2)), (2, 3))
+
 
 if __name__ == '__main__':
     unittest.main()